@@ -2,15 +2,25 @@
 elasticsearch_init.py
 """
 
-import json
 import logging
 import os
+import socket
+import sqlite3
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, Any
+from typing import Optional, Any, Iterable, Iterator, Mapping, Union
+from urllib.parse import urlsplit
 
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from elasticsearch import ApiError, Elasticsearch, TransportError
+from elasticsearch.helpers import BulkIndexError, parallel_bulk
+from elasticsearch.serializer import OrjsonSerializer
 
 HOST_ENDPOINT = os.getenv("ELASTICSEARCH_ENDPOINT", "http://elasticsearch:9200")
 INDEX_NAME = os.getenv("INDEX_NAME", "testcore")
@@ -21,11 +31,27 @@ EMBEDDINGS_FOLDER = "/opt/app/embeddings"
 os.makedirs(EMBEDDINGS_FOLDER, exist_ok=True)
 
 EMBEDDINGS_FILE = os.path.join(EMBEDDINGS_FOLDER, "documents_embeddings.jsonl")
-TMP_FILE = os.getenv("TMP_FILE", "/tmp/merged_dataset.json")
 
 DEFAULT_TIMEOUT = int(os.getenv("DEFAULT_TIMEOUT", "600"))
 FORCE_REINDEX = os.getenv("FORCE_REINDEX", "false").lower() == "true"
-INDEX_BATCH_SIZE = 1000
+# embeddings files bigger than EMBEDDINGS_CHUNK_MIN_BYTES are parsed in parallel
+EMBEDDINGS_WORKERS = int(os.getenv("EMBEDDINGS_WORKERS", str(os.cpu_count() or 1)))
+EMBEDDINGS_CHUNK_MIN_BYTES = 4 * 1024 * 1024
+# when set, embeddings are stored in this SQLite file instead of an in-memory dict
+EMBEDDINGS_DB = os.getenv("EMBEDDINGS_DB")
+# dense_vector values are parsed to float32 by the search engine whatever their textual precision,
+# so rounding is disabled unless ROUND_DIGITS is set (in-memory embeddings only, EMBEDDINGS_DB stores float32)
+ROUND_DIGITS: Optional[int] = int(os.environ["ROUND_DIGITS"]) if os.getenv("ROUND_DIGITS") else None
+MAX_REQUESTS = int(os.getenv("ES_MAX_REQUESTS", "64"))
+# a bulk request is flushed at INDEX_BATCH_SIZE docs or MAX_BULK_BYTES bytes, whichever comes first
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "1000"))
+MAX_BULK_BYTES = int(os.getenv("MAX_BULK_BYTES", str(10 * 1024 * 1024)))
+BULK_THREADS = int(os.getenv("ES_THREADS", "8"))
+BULK_QUEUE_SIZE = int(os.getenv("ES_QUEUE", "4"))
+# gzip the bulk request bodies (Elasticsearch accepts Content-Encoding: gzip out of the box)
+HTTP_COMPRESS = os.getenv("HTTP_COMPRESS", "true").lower() == "true"
+# refresh_interval restored on the index after the bulk load (refreshes are disabled while indexing)
+REFRESH_INTERVAL = os.getenv("REFRESH_INTERVAL", "1s")
 
 logging.basicConfig(
     stream=sys.stdout,
@@ -33,41 +59,73 @@ logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
 )
 log = logging.getLogger("elasticsearch_init")
+# elastic_transport logs every request at INFO level
+logging.getLogger("elastic_transport").setLevel(logging.WARNING)
 
+# shared keep-alive connection pool, reused by every HTTP call of this script
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=64, pool_maxsize=MAX_REQUESTS,
+                       max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504)))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+# readiness probes go without adapter retries (the wait loops back off on their own) and with a short timeout
+PROBE_SESSION = requests.Session()
+PROBE_TIMEOUT = 2
 
-def wait_for_elasticsearch(host_endpoint: str, timeout: int, interval: float = 1.0) -> None:
-    """Waits until Elasticsearch /_cluster/health returns 200."""
+
+# <id, vector> lookup table: an in-memory dict or a SqliteEmbeddings
+Embeddings = Mapping[str, Union[list[float], np.ndarray]]
+
+
+def _port_open(address: tuple[str, int], timeout: float = 1) -> bool:
+    """Returns True if a TCP connection to address can be opened: a cheap pre-check before the HTTP probe."""
+    try:
+        socket.create_connection(address, timeout=timeout).close()
+        return True
+    except OSError:
+        return False
+
+
+def wait_for_elasticsearch(host_endpoint: str, timeout: int, interval: float = 0.1, max_interval: float = 5.0) -> None:
+    """Waits until Elasticsearch /_cluster/health returns 200, polling with exponential backoff."""
     health_url = f"{host_endpoint.rstrip('/')}/_cluster/health"
+    url = urlsplit(host_endpoint)
+    address = (url.hostname or "localhost", url.port or 9200)
 
     log.info("Waiting for Elasticsearch at %s ...", health_url)
 
-    for attempt in range(timeout):
+    deadline = time.monotonic() + timeout
+    delay = interval
+    attempt = 0
+    while time.monotonic() < deadline:
+        attempt += 1
         try:
-            response = requests.get(health_url, timeout=timeout)
-            if response.ok:
-                log.info("Elasticsearch is ready (attempt %d)", attempt + 1)
+            if _port_open(address) and PROBE_SESSION.get(health_url, timeout=PROBE_TIMEOUT).ok:
+                log.info("Elasticsearch is ready (attempt %d)", attempt)
                 return
         except requests.RequestException:
             pass
-        log.debug("  ...still waiting (%d/%d)", attempt + 1, timeout)
-        time.sleep(interval)
+        log.debug("  ...still waiting (attempt %d, next in %.1fs)", attempt, delay)
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, max_interval)
     raise RuntimeError(f"Elasticsearch did not become ready after {timeout} seconds: {health_url}")
 
 
 def create_index(index_endpoint: str, timeout: int) -> None:
     """Creates index if doesn't exist else skips"""
     try:
-        if requests.head(index_endpoint, timeout=timeout).ok:
+        if SESSION.head(index_endpoint, timeout=timeout).ok:
             log.info("Index already exists at %s. Skipping creation.", index_endpoint)
             return
     except requests.RequestException:
         pass
 
-    payload = {"settings": {"index": {"number_of_shards": 1, "number_of_replicas": 0}}}
+    # refresh is disabled for the bulk load and restored by main() once indexing is over
+    payload = {"settings": {"index": {"number_of_shards": 1, "number_of_replicas": 0, "refresh_interval": "-1"}}}
 
     log.info("Creating index at %s ...", index_endpoint)
     try:
-        response = requests.put(index_endpoint, json=payload, timeout=timeout)
+        response = SESSION.put(index_endpoint, json=payload, timeout=timeout)
         response.raise_for_status()
         log.info("Index created successfully, %s", index_endpoint)
     except requests.RequestException as e:
@@ -81,7 +139,7 @@ def get_count(index_endpoint: str, timeout: int) -> int:
 
     params: dict[str, Any] = {"q": "*:*"}
     try:
-        response = requests.get(count_url, params=params, timeout=timeout)
+        response = SESSION.get(count_url, params=params, timeout=timeout)
         response.raise_for_status()
         body = response.json()
         return int(body.get("count", 0))
@@ -90,77 +148,179 @@ def get_count(index_endpoint: str, timeout: int) -> int:
         return 0
 
 
-def load_dataset_to_dict(path: str) -> list[dict[str, Any]]:
-    """Loads dataset from jsonl file to dict (no embeddings)."""
+def _iter_jsonl(p: Path) -> Iterator[dict[str, Any]]:
+    with p.open("rb") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield orjson.loads(line)
+
+
+def iter_dataset(path: str) -> Iterator[dict[str, Any]]:
+    """Streams dataset docs (no embeddings) from jsonl file, one parsed line at a time."""
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(f"Dataset file is not found: {path}")
-    data = []
-    with p.open("r", encoding="utf-8") as file:
+    return _iter_jsonl(p)
+
+
+def _embeddings_chunks(path: str, num_chunks: int) -> list[tuple[int, int]]:
+    """Splits the file into at most num_chunks (start, end) byte ranges aligned to line starts."""
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        offsets = [0]
+        for i in range(1, num_chunks):
+            file.seek(max(size * i // num_chunks, offsets[-1]))
+            file.readline()  # move forward to the start of the next line
+            offsets.append(file.tell())
+        offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+
+
+def _iter_embeddings(path: str, start: int, end: int) -> Iterator[tuple[str, list[float]]]:
+    """Yields (id, vector) for the embeddings lines starting in the [start, end) byte range of the file."""
+    with open(path, "rb") as file:
+        file.seek(start)
+        offset = start
         for line in file:
+            if offset >= end:
+                break
+            line_offset = offset
+            offset += len(line)
             line = line.strip()
-            if line:
-                data.append(json.loads(line))
-    return data
+            if not line:
+                continue
+            try:
+                row = orjson.loads(line)
+                _id = row["id"]
+                vector = row["vector"]
+            except (KeyError, TypeError):  # missing field, or a line that is not an object
+                _id = vector = None
+            except orjson.JSONDecodeError:
+                log.warning("Skipping invalid JSON line at byte %d in embeddings file", line_offset)
+                continue
+            # null or empty ids and null or non-list vectors are skipped like missing ones
+            if not (_id and isinstance(vector, list)):
+                log.debug("Skipping embeddings line at byte %d: missing id or vector", line_offset)
+                continue
+            yield (_id if type(_id) is str else str(_id)), vector
+
+
+def _load_embeddings_chunk(path: str, start: int, end: int) -> dict[str, list[float]]:
+    """Parses the embeddings lines starting in the [start, end) byte range of the file."""
+    return dict(_iter_embeddings(path, start, end))
 
 
 def load_embeddings_to_dict(path: str) -> dict[str, list[float]]:
     """
     Loads embeddings from jsonl file to dict. Each line: {"id":"...","vector":[...] }
     Returns dict of (id, [vector])
+    Big files are split in newline-aligned byte chunks parsed by a pool of EMBEDDINGS_WORKERS processes.
     """
     vectors: dict[str, list[float]] = {}
     p = Path(path)
     if not p.exists():
         log.info("Embeddings file not found: %s", path)
         return vectors
-    with p.open("r", encoding="utf-8") as file:
-        for i, line in enumerate(file, start=1):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                row = json.loads(line)
-                _id = row.get("id")
-                vector = row.get("vector")
-                if _id and isinstance(vector, list):
-                    vectors[str(_id)] = vector
-                else:
-                    log.debug("Skipping embeddings line %d: missing id or vector", i)
-            except json.JSONDecodeError:
-                log.warning("Skipping invalid JSON line %d in embeddings file", i)
+
+    num_chunks = max(1, min(EMBEDDINGS_WORKERS, p.stat().st_size // EMBEDDINGS_CHUNK_MIN_BYTES))
+    chunks = _embeddings_chunks(path, num_chunks)
+    if len(chunks) <= 1:
+        for start, end in chunks:
+            vectors = _load_embeddings_chunk(path, start, end)
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [executor.submit(_load_embeddings_chunk, path, start, end) for start, end in chunks]
+            # merge in file order so that duplicated ids keep the last vector
+            for future in futures:
+                vectors.update(future.result())
     log.info("Loaded %d embeddings from %s", len(vectors), path)
     return vectors
 
 
-def round_vector(vector: list[float], digits: int = 12) -> list[float]:
-    """Rounds each value in the vector to digits=12 decimals."""
-    return [round(float(x), digits) for x in vector]
+class SqliteEmbeddings(Mapping[str, np.ndarray]):
+    """Read-only <id, vector> map backed by a SQLite file, vectors are stored as packed float32 bytes."""
+
+    def __init__(self, db_path: str):
+        # the merge generator may be consumed by another thread (one at a time)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
 
+    def __getitem__(self, key: str) -> np.ndarray:
+        row = self._conn.execute("SELECT vector FROM embeddings WHERE id = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return np.frombuffer(row[0], dtype=np.float32)
 
-def merge_docs_with_embeddings(docs: list[dict[str, Any]], embeddings: dict[str, list[float]],
-                               output_path: Optional[str] = None) -> list[dict[str, Any]]:
-    """ Merges two dicts one containing the doc fields e.g. title, context, etc.
-    while the other one contains <id, vector> fields"""
-    merged = []
-    for d in docs:
-        doc = dict(d)
-        doc_id = str(doc.get("id"))
-        if not doc_id:
-            log.debug("Document missing id")
+    def __iter__(self) -> Iterator[str]:
+        return (key for (key,) in self._conn.execute("SELECT id FROM embeddings"))
 
-        vector = embeddings.get(doc_id)
-        if vector is not None:
-            doc["vector"] = round_vector(vector, digits=12)
-        merged.append(doc)
-    if output_path:
-        with open(output_path, "w", encoding="utf-8") as file:
-            json.dump(merged, file, ensure_ascii=False)
-        log.info("Wrote merged dataset to %s", output_path)
-    return merged
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
 
 
-def get_embedding_dimension(embeddings: dict[str, list[float]]) -> Optional[int]:
+def load_embeddings_to_sqlite(path: str, db_path: str) -> Embeddings:
+    """
+    Streams embeddings from the jsonl file into a SQLite file at db_path, so that vectors are
+    never all held in memory. Returns a SqliteEmbeddings map reading from it.
+    """
+    p = Path(path)
+    if not p.exists():
+        log.info("Embeddings file not found: %s", path)
+        return {}
+
+    rows = ((_id, np.asarray(vector, dtype=np.float32).tobytes())
+            for _id, vector in _iter_embeddings(path, 0, p.stat().st_size))
+    conn = sqlite3.connect(db_path)
+    try:
+        # one-time ingest of a throwaway file: no need for journaling
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("DROP TABLE IF EXISTS embeddings")
+        conn.execute("CREATE TABLE embeddings (id TEXT PRIMARY KEY, vector BLOB NOT NULL) WITHOUT ROWID")
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (id, vector) VALUES (?, ?)", rows)
+    finally:
+        conn.close()
+
+    embeddings = SqliteEmbeddings(db_path)
+    log.info("Stored %d embeddings from %s into %s", len(embeddings), path, db_path)
+    return embeddings
+
+
+def round_embeddings(embeddings: dict[str, Any], digits: int) -> dict[str, np.ndarray]:
+    """
+    Rounds every vector to `digits` decimals at once: the vectors are stacked in a single (N, dim)
+    matrix rounded in place by one vectorized pass, then each id maps to its row (a view, no copy).
+    """
+    if not embeddings:
+        return embeddings
+    matrix = np.asarray(list(embeddings.values()), dtype=np.float64)
+    np.round(matrix, digits, out=matrix)
+    return dict(zip(embeddings.keys(), matrix))
+
+
+def split_id(doc: dict[str, Any]) -> tuple[Optional[str], dict[str, Any]]:
+    """Separates the "id" from the other doc fields, which become the _source sent to Elasticsearch.
+    The parsed doc dict is reused as the body (no copy)."""
+    doc_id = doc.pop("id", None)
+    return (str(doc_id) if doc_id is not None else None), doc
+
+
+def merge_one(doc: dict[str, Any], embeddings: Embeddings) -> tuple[Optional[str], dict[str, Any]]:
+    """ Adds to a dict containing the doc fields e.g. title, context, etc. the vector
+    found in the <id, vector> embeddings dict. Returns the (doc_id, body) pair."""
+    doc_id, body = split_id(doc)
+    if doc_id is None:
+        log.debug("Document missing id")
+        return doc_id, body
+
+    vector = embeddings.get(doc_id)
+    if vector is not None:
+        body["vector"] = vector
+    return doc_id, body
+
+
+def get_embedding_dimension(embeddings: Embeddings) -> Optional[int]:
     """Returns embedding dimension size or None."""
     if not embeddings:
         return None
@@ -186,7 +346,7 @@ def create_vector_field(index_endpoint: str, dimension: int, timeout: int) -> No
 
     log.info("Creating dense_vector field (dimension=%d) at %s", dimension, mapping_url)
     try:
-        response = requests.put(mapping_url, json=payload, timeout=timeout)
+        response = SESSION.put(mapping_url, json=payload, timeout=timeout)
         if response.status_code >= 400:
             log.error("Failed to update mapping. Status: %s, Body: %s",
                       response.status_code, response.text)
@@ -199,61 +359,81 @@ def create_vector_field(index_endpoint: str, dimension: int, timeout: int) -> No
     return
 
 
-def index_documents(host_endpoint: str, index_name: str, docs: list[dict[str, Any]], timeout: int) -> None:
-    """Sends documents to Elasticsearch using /_bulk endpoint in batches."""
-    total_docs = len(docs)
-    if total_docs == 0:
-        log.info("No documents provided for indexing.")
-        return
-
-    log.info("Indexing %d documents into Elasticsearch index '%s'", total_docs, index_name)
-
-    num_batches = (total_docs + INDEX_BATCH_SIZE - 1) // INDEX_BATCH_SIZE
+def update_index_settings(index_endpoint: str, settings: dict[str, Any], timeout: int) -> None:
+    """Sends PUT to /_settings to update the given dynamic index settings"""
+    settings_url = f"{index_endpoint.rstrip('/')}/_settings"
 
-    bulk_url = f"{host_endpoint.rstrip('/')}/_bulk"
-
-    for i in range(num_batches):
-        start_index = i * INDEX_BATCH_SIZE
-        end_index = min((i + 1) * INDEX_BATCH_SIZE, total_docs)
-        batch = [doc.copy() for doc in docs[start_index:end_index]]
-
-        if not batch:
-            continue
-
-        body_lines = []
-        for doc in batch:
-            metadata = {"index": {"_index": index_name}}
+    log.info("Updating index settings %s at %s", settings, settings_url)
+    try:
+        response = SESSION.put(settings_url, json={"index": settings}, timeout=timeout)
+        if response.status_code >= 400:
+            log.error("Failed to update index settings. Status: %s, Body: %s",
+                      response.status_code, response.text)
+    except requests.RequestException as e:
+        log.error("Failed to update index settings: %s", e)
 
-            if "id" in doc:
-                metadata["index"]["_id"] = str(doc.pop("id"))
 
-            body_lines.append(json.dumps(metadata))
-            body_lines.append(json.dumps(doc))
+def force_merge(index_endpoint: str, timeout: int) -> None:
+    """Sends POST to /_forcemerge to merge the freshly bulk-loaded index down to a single segment"""
+    merge_url = f"{index_endpoint.rstrip('/')}/_forcemerge"
 
-        payload = "\n".join(body_lines) + "\n"
+    log.info("Force merging index at %s ...", merge_url)
+    try:
+        response = SESSION.post(merge_url, params={"max_num_segments": 1}, timeout=timeout)
+        response.raise_for_status()
+        log.info("Force merge completed (status=%s)", response.status_code)
+    except requests.RequestException as e:
+        log.warning("Failed to force merge index: %s", e)
 
-        log.info(f"Sending Batch {i + 1}/{num_batches} ({len(batch)} docs)")
 
-        try:
-            headers = {"Content-Type": "application/x-ndjson"}
-            response = requests.post(bulk_url, data=payload, headers=headers, timeout=timeout)
-            response.raise_for_status()
+def _bulk_actions(index_name: str, docs: Iterable[tuple[Optional[str], dict[str, Any]]]) -> Iterator[dict[str, Any]]:
+    """Yields one bulk index action per (doc_id, body) pair."""
+    for doc_id, body in docs:
+        action: dict[str, Any] = {"_index": index_name, "_source": body}
+        if doc_id is not None:
+            action["_id"] = doc_id
+        yield action
 
-            log.debug(f"Batch {i + 1} indexing successful (status={response.status_code})")
 
-        except requests.RequestException as e:
-            log.error(f"Failed to index batch {i + 1}: {e}")
-            raise Exception(f"Failed during batch {i + 1} indexing.") from e
+def index_documents(host_endpoint: str, index_name: str, docs: Iterable[tuple[Optional[str], dict[str, Any]]],
+                    timeout: int) -> None:
+    """
+    Sends documents to Elasticsearch using parallel_bulk, which spreads the /_bulk requests over
+    a pool of ES_THREADS threads. Docs are (doc_id, body) pairs consumed lazily, so `docs` can be a generator.
+    """
+    log.info("Indexing documents into Elasticsearch index '%s' (threads=%d, chunk_size=%d, max_chunk_bytes=%d)",
+             index_name, BULK_THREADS, INDEX_BATCH_SIZE, MAX_BULK_BYTES)
 
-    log.info(
-        "Successfully indexed %d documents in %d batches.", total_docs, num_batches
-    )
+    # orjson serializes the bulk actions (dense vectors included) much faster than stdlib json
+    es = Elasticsearch(host_endpoint, request_timeout=timeout, connections_per_node=MAX_REQUESTS,
+                       serializer=OrjsonSerializer(), http_compress=HTTP_COMPRESS)
+    indexed_docs = 0
+    try:
+        # raise_on_error (default) makes parallel_bulk raise BulkIndexError on any failed item
+        for _ok, _item in parallel_bulk(es, _bulk_actions(index_name, docs),
+                                        thread_count=BULK_THREADS,
+                                        chunk_size=INDEX_BATCH_SIZE,
+                                        max_chunk_bytes=MAX_BULK_BYTES,
+                                        queue_size=BULK_QUEUE_SIZE):
+            indexed_docs += 1
+            if indexed_docs % INDEX_BATCH_SIZE == 0:
+                log.info("Indexed %d docs", indexed_docs)
+    except (BulkIndexError, ApiError, TransportError) as e:
+        log.error("Failed to index documents: %s", e)
+        raise Exception(f"Failed during bulk indexing after {indexed_docs} docs.") from e
+    finally:
+        es.close()
+
+    if indexed_docs == 0:
+        log.info("No documents provided for indexing.")
+        return
+    log.info("Successfully indexed %d documents.", indexed_docs)
 
 
 def main() -> int:
     log.info("Starting elasticsearch_init.py")
     try:
-        wait_for_elasticsearch(host_endpoint=HOST_ENDPOINT, timeout=DEFAULT_TIMEOUT, interval=1.0)
+        wait_for_elasticsearch(host_endpoint=HOST_ENDPOINT, timeout=DEFAULT_TIMEOUT)
     except Exception as e:
         log.error("Elasticsearch is not available: %s", e)
         sys.exit(1)
@@ -262,8 +442,13 @@ def main() -> int:
     log.info("Elasticsearch has count = %d docs", count_docs)
 
     if count_docs == 0 or FORCE_REINDEX:
-        docs = load_dataset_to_dict(DATASET)
-        embeddings = load_embeddings_to_dict(EMBEDDINGS_FILE)
+        embeddings: Embeddings
+        if EMBEDDINGS_DB:
+            embeddings = load_embeddings_to_sqlite(EMBEDDINGS_FILE, EMBEDDINGS_DB)
+        else:
+            embeddings = load_embeddings_to_dict(EMBEDDINGS_FILE)
+            if ROUND_DIGITS is not None:
+                embeddings = round_embeddings(embeddings, ROUND_DIGITS)
 
         if embeddings:
             embedding_dimension = get_embedding_dimension(embeddings)
@@ -272,15 +457,21 @@ def main() -> int:
                 sys.exit(1)
             log.info("Detected embedding dimension = %d", embedding_dimension)
 
-            merged_docs = merge_docs_with_embeddings(docs, embeddings, output_path=TMP_FILE)
             create_vector_field(index_endpoint=INDEX_ENDPOINT, dimension=embedding_dimension, timeout=DEFAULT_TIMEOUT)
-
-            index_documents(host_endpoint=HOST_ENDPOINT, index_name=INDEX_NAME,
-                            docs=merged_docs, timeout=DEFAULT_TIMEOUT)
+            docs = (merge_one(d, embeddings) for d in iter_dataset(DATASET))
         else:
             log.info("Using plain dataset without embeddings")
+            docs = (split_id(d) for d in iter_dataset(DATASET))
+
+        # no refresh (nor replica) work while the bulk load runs, see the tune-for-indexing-speed guide
+        update_index_settings(index_endpoint=INDEX_ENDPOINT, settings={"refresh_interval": "-1", "number_of_replicas": 0},
+                              timeout=DEFAULT_TIMEOUT)
+        try:
             index_documents(host_endpoint=HOST_ENDPOINT, index_name=INDEX_NAME, docs=docs, timeout=DEFAULT_TIMEOUT)
-            Path(TMP_FILE).unlink(missing_ok=True)
+        finally:
+            update_index_settings(index_endpoint=INDEX_ENDPOINT, settings={"refresh_interval": REFRESH_INTERVAL},
+                                  timeout=DEFAULT_TIMEOUT)
+        force_merge(index_endpoint=INDEX_ENDPOINT, timeout=DEFAULT_TIMEOUT)
     else:
         log.info("Skipping indexing as there are already docs indexed. Use FORCE_REINDEX=true to force re-indexing")
 
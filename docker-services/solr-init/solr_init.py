@@ -2,15 +2,27 @@
 solr_init.py
 """
 
-import json
+import gzip
 import logging
 import os
+import queue
+import socket
+import sqlite3
 import sys
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, Any
+from typing import Optional, Any, Iterable, Iterator, Mapping, Union
+from urllib.parse import urlsplit
 
+import cbor2
+import ijson
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 COLLECTION_ENDPOINT = os.getenv("COLLECTION_ENDPOINT", "http://solr:8983/solr/testcore")
 DATASET = os.getenv("DATASET", "/opt/app/data/dataset.json")
@@ -19,11 +31,27 @@ EMBEDDINGS_FOLDER = "/opt/app/embeddings"
 os.makedirs(EMBEDDINGS_FOLDER, exist_ok=True)
 
 EMBEDDINGS_FILE = os.path.join(EMBEDDINGS_FOLDER, "documents_embeddings.jsonl")
-TMP_FILE = os.getenv("TMP_FILE", "/tmp/merged_dataset.json")
 
 DEFAULT_TIMEOUT = int(os.getenv("DEFAULT_TIMEOUT", "600"))
 FORCE_REINDEX = os.getenv("FORCE_REINDEX", "false").lower() == "true"
-INDEX_BATCH_SIZE = 1000
+# embeddings files bigger than EMBEDDINGS_CHUNK_MIN_BYTES are parsed in parallel
+EMBEDDINGS_WORKERS = int(os.getenv("EMBEDDINGS_WORKERS", str(os.cpu_count() or 1)))
+EMBEDDINGS_CHUNK_MIN_BYTES = 4 * 1024 * 1024
+# when set, embeddings are stored in this SQLite file instead of an in-memory dict
+EMBEDDINGS_DB = os.getenv("EMBEDDINGS_DB")
+# DenseVectorField values are parsed to float32 by the search engine whatever their textual precision,
+# so rounding is disabled unless ROUND_DIGITS is set (in-memory embeddings only, EMBEDDINGS_DB stores float32)
+ROUND_DIGITS: Optional[int] = int(os.environ["ROUND_DIGITS"]) if os.getenv("ROUND_DIGITS") else None
+MAX_REQUESTS = int(os.getenv("SOLR_MAX_REQUESTS", "64"))
+# a batch is flushed at INDEX_BATCH_SIZE docs or MAX_BULK_BYTES bytes, whichever comes first
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "1000"))
+MAX_BULK_BYTES = int(os.getenv("MAX_BULK_BYTES", str(10 * 1024 * 1024)))
+# format of the docs sent to Solr: "cbor" (/update/cbor, smaller and faster to parse) or "json" (/update)
+UPDATE_FORMAT = os.getenv("SOLR_UPDATE_FORMAT", "cbor").lower()
+# gzip the /update request bodies; requires request inflation to be enabled in Solr's Jetty gzip handler
+HTTP_COMPRESS = os.getenv("HTTP_COMPRESS", "false").lower() == "true"
+# max number of encoded batches waiting to be sent
+UPDATE_QUEUE_SIZE = int(os.getenv("SOLR_QUEUE", "4"))
 
 logging.basicConfig(
     stream=sys.stdout,
@@ -32,21 +60,50 @@ logging.basicConfig(
 )
 log = logging.getLogger("solr_init")
 
+# shared keep-alive connection pool, reused by every HTTP call of this script
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=64, pool_maxsize=MAX_REQUESTS,
+                       max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504)))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+# readiness probes go without adapter retries (the wait loops back off on their own) and with a short timeout
+PROBE_SESSION = requests.Session()
+PROBE_TIMEOUT = 2
 
-def wait_for_solr_core(endpoint: str, timeout: int, interval: float = 1.0) -> None:
-    """Waits until Solr core /admin/ping endpoint returns 200 or timeouts."""
+
+# <id, vector> lookup table: an in-memory dict or a SqliteEmbeddings
+Embeddings = Mapping[str, Union[list[float], np.ndarray]]
+
+
+def _port_open(address: tuple[str, int], timeout: float = 1) -> bool:
+    """Returns True if a TCP connection to address can be opened: a cheap pre-check before the HTTP probe."""
+    try:
+        socket.create_connection(address, timeout=timeout).close()
+        return True
+    except OSError:
+        return False
+
+
+def wait_for_solr_core(endpoint: str, timeout: int, interval: float = 0.1, max_interval: float = 5.0) -> None:
+    """Waits until Solr core /admin/ping endpoint returns 200 or timeouts, polling with exponential backoff."""
     ping_url = f"{endpoint.rstrip('/')}/admin/ping?wt=json"
+    url = urlsplit(endpoint)
+    address = (url.hostname or "localhost", url.port or 8983)
     log.info("Waiting for Solr core at %s ...", ping_url)
-    for attempt in range(timeout):
+    deadline = time.monotonic() + timeout
+    delay = interval
+    attempt = 0
+    while time.monotonic() < deadline:
+        attempt += 1
         try:
-            response = requests.get(ping_url, timeout=DEFAULT_TIMEOUT)
-            if response.ok:
-                log.info("Core is ready (attempt %d)", attempt + 1)
+            if _port_open(address) and PROBE_SESSION.get(ping_url, timeout=PROBE_TIMEOUT).ok:
+                log.info("Core is ready (attempt %d)", attempt)
                 return
         except requests.RequestException:
             pass
-        log.debug("  ...still waiting (%d/%d)", attempt + 1, timeout)
-        time.sleep(interval)
+        log.debug("  ...still waiting (attempt %d, next in %.1fs)", attempt, delay)
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, max_interval)
     raise RuntimeError(f"Solr core did not become ready after {timeout} seconds: {ping_url}")
 
 
@@ -55,7 +112,7 @@ def get_num_found(endpoint: str) -> int:
     select_url = f"{endpoint.rstrip('/')}/select"
     params: dict[str, Any] = {"q": "*:*", "wt": "json", "rows": 0}
     try:
-        response = requests.get(select_url, params=params, timeout=DEFAULT_TIMEOUT)
+        response = SESSION.get(select_url, params=params, timeout=DEFAULT_TIMEOUT)
         response.raise_for_status()
         body = response.json()
         num_found = body.get("response", {}).get("numFound", 0)
@@ -65,74 +122,165 @@ def get_num_found(endpoint: str) -> int:
         return 0
 
 
-def load_dataset_to_dict(path: str) -> list[dict[str, Any]]:
-    """Loads dataset (no embeddings) """
+def _iter_json_array(p: Path) -> Iterator[dict[str, Any]]:
+    with p.open("rb") as file:
+        yield from ijson.items(file, "item", use_float=True)
+
+
+def iter_dataset(path: str) -> Iterator[dict[str, Any]]:
+    """Streams dataset docs (no embeddings) from a JSON array file, one item at a time."""
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(f"Dataset file not found: {path}")
-    with p.open("r", encoding="utf-8") as file:
-        data = json.load(file)
-        if isinstance(data, list):
-            return data
-        else:
-            raise ValueError("Expected dataset JSON file to be an array of documents")
+    return _iter_json_array(p)
+
+
+def _embeddings_chunks(path: str, num_chunks: int) -> list[tuple[int, int]]:
+    """Splits the file into at most num_chunks (start, end) byte ranges aligned to line starts."""
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        offsets = [0]
+        for i in range(1, num_chunks):
+            file.seek(max(size * i // num_chunks, offsets[-1]))
+            file.readline()  # move forward to the start of the next line
+            offsets.append(file.tell())
+        offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+
+
+def _iter_embeddings(path: str, start: int, end: int) -> Iterator[tuple[str, list[float]]]:
+    """Yields (id, vector) for the embeddings lines starting in the [start, end) byte range of the file."""
+    with open(path, "rb") as file:
+        file.seek(start)
+        offset = start
+        for line in file:
+            if offset >= end:
+                break
+            line_offset = offset
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = orjson.loads(line)
+                _id = row["id"]
+                vector = row["vector"]
+            except (KeyError, TypeError):  # missing field, or a line that is not an object
+                _id = vector = None
+            except orjson.JSONDecodeError:
+                log.warning("Skipping invalid JSON line at byte %d in embeddings file", line_offset)
+                continue
+            # null or empty ids and null or non-list vectors are skipped like missing ones
+            if not (_id and isinstance(vector, list)):
+                log.debug("Skipping embeddings line at byte %d: missing id or vector", line_offset)
+                continue
+            yield (_id if type(_id) is str else str(_id)), vector
+
+
+def _load_embeddings_chunk(path: str, start: int, end: int) -> dict[str, list[float]]:
+    """Parses the embeddings lines starting in the [start, end) byte range of the file."""
+    return dict(_iter_embeddings(path, start, end))
 
 
 def load_embeddings_to_dict(path: str) -> dict[str, list[float]]:
     """
     Loads embeddings from a jsonl file. Each line: {"id":"...","vector":[...] }
     Returns dict of (id, [vector])
+    Big files are split in newline-aligned byte chunks parsed by a pool of EMBEDDINGS_WORKERS processes.
     """
     vectors: dict[str, list[float]] = {}
     p = Path(path)
     if not p.exists():
         log.info("Embeddings file not found: %s", path)
         return vectors
-    with p.open("r", encoding="utf-8") as file:
-        for i, line in enumerate(file, start=1):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                row = json.loads(line)
-                _id = row.get("id")
-                vector = row.get("vector")
-                if _id and isinstance(vector, list):
-                    vectors[str(_id)] = vector
-                else:
-                    log.debug("Skipping embeddings line %d: missing id or vector", i)
-            except json.JSONDecodeError:
-                log.warning("Skipping invalid JSON line %d in embeddings file", i)
+
+    num_chunks = max(1, min(EMBEDDINGS_WORKERS, p.stat().st_size // EMBEDDINGS_CHUNK_MIN_BYTES))
+    chunks = _embeddings_chunks(path, num_chunks)
+    if len(chunks) <= 1:
+        for start, end in chunks:
+            vectors = _load_embeddings_chunk(path, start, end)
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [executor.submit(_load_embeddings_chunk, path, start, end) for start, end in chunks]
+            # merge in file order so that duplicated ids keep the last vector
+            for future in futures:
+                vectors.update(future.result())
     log.info("Loaded %d embeddings from %s", len(vectors), path)
     return vectors
 
 
-def round_vector(vector: list[float], digits: int = 12) -> list[float]:
-    """Rounds each value in the vector to digits=12 decimals"""
-    return [round(float(x), digits) for x in vector]
+class SqliteEmbeddings(Mapping[str, np.ndarray]):
+    """Read-only <id, vector> map backed by a SQLite file, vectors are stored as packed float32 bytes."""
+
+    def __init__(self, db_path: str):
+        # the merge generator may be consumed by another thread (one at a time)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        row = self._conn.execute("SELECT vector FROM embeddings WHERE id = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for (key,) in self._conn.execute("SELECT id FROM embeddings"))
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def load_embeddings_to_sqlite(path: str, db_path: str) -> Embeddings:
+    """
+    Streams embeddings from the jsonl file into a SQLite file at db_path, so that vectors are
+    never all held in memory. Returns a SqliteEmbeddings map reading from it.
+    """
+    p = Path(path)
+    if not p.exists():
+        log.info("Embeddings file not found: %s", path)
+        return {}
+
+    rows = ((_id, np.asarray(vector, dtype=np.float32).tobytes())
+            for _id, vector in _iter_embeddings(path, 0, p.stat().st_size))
+    conn = sqlite3.connect(db_path)
+    try:
+        # one-time ingest of a throwaway file: no need for journaling
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("DROP TABLE IF EXISTS embeddings")
+        conn.execute("CREATE TABLE embeddings (id TEXT PRIMARY KEY, vector BLOB NOT NULL) WITHOUT ROWID")
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (id, vector) VALUES (?, ?)", rows)
+    finally:
+        conn.close()
+
+    embeddings = SqliteEmbeddings(db_path)
+    log.info("Stored %d embeddings from %s into %s", len(embeddings), path, db_path)
+    return embeddings
+
+
+def round_embeddings(embeddings: dict[str, Any], digits: int) -> dict[str, np.ndarray]:
+    """Rounds all the vectors to `digits` decimals with one np.round over the stacked (N, dim) matrix.
+    Returns dict of (id, row view of the matrix)"""
+    if not embeddings:
+        return embeddings
+    matrix = np.asarray(list(embeddings.values()), dtype=np.float64)
+    np.round(matrix, digits, out=matrix)
+    return dict(zip(embeddings.keys(), matrix))
 
 
-def merge_docs_with_embeddings(docs: list[dict[str, Any]], embeddings: dict[str, list[float]],
-                               output_path: Optional[str] = None) -> list[dict[str, Any]]:
-    merged = []
-    for d in docs:
-        doc = dict(d)
-        doc_id = str(doc.get("id"))
-        if not doc_id:
-            log.debug("Document missing id")
+def merge_one(doc: dict[str, Any], embeddings: Embeddings) -> dict[str, Any]:
+    """Adds the vector found in the <id, vector> embeddings dict to the doc, in place."""
+    doc_id = str(doc.get("id"))
+    if not doc_id:
+        log.debug("Document missing id")
 
-        vector = embeddings.get(doc_id)
-        if vector is not None:
-            doc["vector"] = round_vector(vector, digits=12)
-        merged.append(doc)
-    if output_path:
-        with open(output_path, "w", encoding="utf-8") as file:
-            json.dump(merged, file, ensure_ascii=False)
-        log.info("Wrote merged dataset to %s", output_path)
-    return merged
+    vector = embeddings.get(doc_id)
+    if vector is not None:
+        doc["vector"] = vector
+    return doc
 
 
-def get_embedding_dimension_size(embeddings: dict[str, list[float]]) -> Optional[int]:
+def get_embedding_dimension_size(embeddings: Embeddings) -> Optional[int]:
     """Returns embedding dimension size or None"""
     if not embeddings:
         return None
@@ -163,7 +311,7 @@ def create_vector_field(endpoint: str, dimension: int) -> None:
     }
     log.info("Creating vector field (dimension=%d) at %s", dimension, schema_url)
     try:
-        response = requests.post(schema_url, json=payload, timeout=DEFAULT_TIMEOUT)
+        response = SESSION.post(schema_url, json=payload, timeout=DEFAULT_TIMEOUT)
         if response.status_code >= 400:
             log.debug("Response (status=%s)", response.status_code)
             return
@@ -174,64 +322,169 @@ def create_vector_field(endpoint: str, dimension: int) -> None:
     return
 
 
-def index_documents(endpoint: str, docs: list[dict[str, Any]]) -> None:
+def set_auto_commit_max_time(endpoint: str, max_time: Optional[int]) -> None:
     """
-    Sends documents to /update endpoint in batches and commit at the end.
+    Sends POST to /config endpoint to override updateHandler.autoCommit.maxTime,
+    or to restore the solrconfig.xml value when max_time is None.
     """
-    total_docs = len(docs)
-    if total_docs == 0:
-        log.info("No documents provided for indexing.")
-        return
+    config_url = f"{endpoint.rstrip('/')}/config"
+    if max_time is None:
+        payload: dict[str, Any] = {"unset-property": "updateHandler.autoCommit.maxTime"}
+    else:
+        payload = {"set-property": {"updateHandler.autoCommit.maxTime": max_time}}
+    log.info("Updating autoCommit config at %s: %s", config_url, payload)
+    try:
+        response = SESSION.post(config_url, json=payload, timeout=DEFAULT_TIMEOUT)
+        if response.status_code >= 400:
+            log.error("Failed to update autoCommit config. Status: %s, Body: %s",
+                      response.status_code, response.text)
+    except requests.RequestException as e:
+        log.error("Failed to update autoCommit config: %s", e)
 
-    log.info("Indexing %d documents into Solr", total_docs)
-    num_batches = (total_docs + INDEX_BATCH_SIZE - 1) // INDEX_BATCH_SIZE
 
-    update_url_no_commit = f"{endpoint.rstrip('/')}/update?commit=false"
-    update_url_commit = f"{endpoint.rstrip('/')}/update?commit=true"
+def _cbor_default(encoder: cbor2.CBOREncoder, value: Any) -> None:
+    """Encodes the NumPy vectors that cbor2 doesn't know about as plain arrays"""
+    if isinstance(value, np.ndarray):
+        encoder.encode(value.tolist())
+    else:
+        raise cbor2.CBOREncodeError(f"cannot serialize type {type(value).__name__}")
 
-    with requests.Session() as session:
 
-        if FORCE_REINDEX:
-            try:
-                session.post(update_url_commit, json={"delete": {"query": "*:*"}}, timeout=DEFAULT_TIMEOUT)
-                log.info("Deleted all documents before reindexing.")
-            except requests.RequestException as e:
-                log.error("Failed to delete all documents before reindexing: %s", e)
-                raise Exception("Failed to delete all documents before reindexing") from e
+def _cbor_array_header(length: int) -> bytes:
+    """Returns the CBOR header of a definite-length array (major type 4) of `length` items"""
+    if length < 24:
+        return bytes([0x80 | length])
+    if length < 0x100:
+        return bytes([0x98, length])
+    if length < 0x10000:
+        return b"\x99" + length.to_bytes(2, "big")
+    return b"\x9a" + length.to_bytes(4, "big")
+
 
+def _encode_doc(doc: dict[str, Any]) -> bytes:
+    if UPDATE_FORMAT == "cbor":
+        return cbor2.dumps(doc, default=_cbor_default)
+    return orjson.dumps(doc, option=orjson.OPT_SERIALIZE_NUMPY)
 
-        for i in range(num_batches):
-            start_index = i * INDEX_BATCH_SIZE
-            end_index = min((i + 1) * INDEX_BATCH_SIZE, total_docs)
-            batch = docs[start_index:end_index]
 
-            if not batch:
+def _encode_batch(encoded_docs: list[bytes]) -> bytes:
+    if UPDATE_FORMAT == "cbor":
+        return _cbor_array_header(len(encoded_docs)) + b"".join(encoded_docs)
+    return b"[" + b",".join(encoded_docs) + b"]"
+
+
+def _iter_batches(docs: Iterable[dict[str, Any]]) -> Iterator[tuple[int, bytes]]:
+    """
+    Serializes docs into UPDATE_FORMAT array payloads of at most INDEX_BATCH_SIZE docs or MAX_BULK_BYTES bytes.
+    Yields (number of docs, payload) tuples.
+    """
+    buf: list[bytes] = []
+    size = 0
+    for doc in docs:
+        encoded = _encode_doc(doc)
+        buf.append(encoded)
+        size += len(encoded) + 1
+        if size >= MAX_BULK_BYTES or len(buf) >= INDEX_BATCH_SIZE:
+            yield len(buf), _encode_batch(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield len(buf), _encode_batch(buf)
+
+
+def _produce_batches(docs: Iterable[dict[str, Any]], batches: "queue.Queue[Any]", stop: threading.Event) -> None:
+    """
+    Encodes (and compresses) the batches on a background thread and hands them over through the bounded
+    `batches` queue, so that encoding overlaps the POSTs. Ends with None, or with the exception raised.
+    """
+    def _put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=1)
+                return True
+            except queue.Full:
                 continue
+        return False
+
+    try:
+        for batch_size, payload in _iter_batches(docs):
+            if HTTP_COMPRESS:
+                # level 1 keeps the CPU cost low, text-encoded floats still compress 3-4x
+                payload = gzip.compress(payload, compresslevel=1)
+            if not _put((batch_size, payload)):
+                return
+        _put(None)
+    except Exception as e:
+        _put(e)
+
 
-            is_last_batch = (i == num_batches - 1)
+def index_documents(endpoint: str, docs: Iterable[dict[str, Any]]) -> None:
+    """
+    Sends documents to /update endpoint in batches and commit at the end.
+    Docs are consumed lazily, so `docs` can be a generator.
+    """
+    log.info("Indexing documents into Solr")
 
-            current_update_url = update_url_commit if is_last_batch else update_url_no_commit
-            commit_status = "true" if is_last_batch else "false"
+    update_url_no_commit = f"{endpoint.rstrip('/')}/update{'/cbor' if UPDATE_FORMAT == 'cbor' else ''}?commit=false"
+    update_url_commit = f"{endpoint.rstrip('/')}/update?commit=true"
 
-            log.info(f"Sending Batch {i + 1}/{num_batches} ({len(batch)} docs, commit={commit_status})")
+    if FORCE_REINDEX:
+        try:
+            SESSION.post(update_url_commit, json={"delete": {"query": "*:*"}}, timeout=DEFAULT_TIMEOUT)
+            log.info("Deleted all documents before reindexing.")
+        except requests.RequestException as e:
+            log.error("Failed to delete all documents before reindexing: %s", e)
+            raise Exception("Failed to delete all documents before reindexing") from e
+
+    headers = {"Content-Type": "application/cbor" if UPDATE_FORMAT == "cbor" else "application/json"}
+    if HTTP_COMPRESS:
+        headers["Content-Encoding"] = "gzip"
+    total_docs = 0
+    num_batches = 0
+    batches: "queue.Queue[Any]" = queue.Queue(maxsize=UPDATE_QUEUE_SIZE)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce_batches, args=(docs, batches, stop), name="batch-producer", daemon=True)
+    producer.start()
+    try:
+        while (item := batches.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            batch_size, payload = item
+            num_batches += 1
+            log.info(f"Sending Batch {num_batches} ({batch_size} docs, {len(payload)} bytes, commit=false)")
 
             try:
-                response = session.post(current_update_url, json=batch, timeout=DEFAULT_TIMEOUT)
+                response = SESSION.post(update_url_no_commit, data=payload, headers=headers, timeout=DEFAULT_TIMEOUT)
                 response.raise_for_status()
-                log.debug(f"Batch {i + 1} indexing successful (status={response.status_code})")
+                log.debug(f"Batch {num_batches} indexing successful (status={response.status_code})")
 
             except requests.RequestException as e:
-                log.error(f"Failed to index batch {i + 1}: {e}")
-                raise Exception(f"Failed during batch {i + 1} indexing.") from e
+                log.error(f"Failed to index batch {num_batches}: {e}")
+                raise Exception(f"Failed during batch {num_batches} indexing.") from e
+            total_docs += batch_size
+    finally:
+        stop.set()
+        producer.join()
+
+    if total_docs == 0:
+        log.info("No documents provided for indexing.")
+        return
+
+    try:
+        response = SESSION.post(update_url_commit, json=[], timeout=DEFAULT_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        log.error(f"Failed to commit indexed documents: {e}")
+        raise Exception("Failed to commit indexed documents.") from e
 
-        log.info("Successfully indexed %d documents in %d batches.", total_docs, num_batches)
+    log.info("Successfully indexed %d documents in %d batches.", total_docs, num_batches)
 
 
 
 def main() -> int:
     log.info("Starting solr_init.py")
     try:
-        wait_for_solr_core(COLLECTION_ENDPOINT, timeout=DEFAULT_TIMEOUT, interval=1.0)
+        wait_for_solr_core(COLLECTION_ENDPOINT, timeout=DEFAULT_TIMEOUT)
     except Exception as e:
         log.error("Solr core not available: %s", e)
         sys.exit(1)
@@ -240,8 +493,13 @@ def main() -> int:
     log.info("Solr reports numFound = %d", num_found)
 
     if num_found == 0 or FORCE_REINDEX:
-        docs = load_dataset_to_dict(DATASET)
-        embeddings = load_embeddings_to_dict(EMBEDDINGS_FILE)
+        embeddings: Embeddings
+        if EMBEDDINGS_DB:
+            embeddings = load_embeddings_to_sqlite(EMBEDDINGS_FILE, EMBEDDINGS_DB)
+        else:
+            embeddings = load_embeddings_to_dict(EMBEDDINGS_FILE)
+            if ROUND_DIGITS is not None:
+                embeddings = round_embeddings(embeddings, ROUND_DIGITS)
 
         if embeddings:
             embedding_dimension_size = get_embedding_dimension_size(embeddings)
@@ -250,14 +508,18 @@ def main() -> int:
                 sys.exit(1)
             log.info("Detected embedding dimension = %d", embedding_dimension_size)
 
-            merged_docs = merge_docs_with_embeddings(docs, embeddings, output_path=TMP_FILE)
             create_vector_field(COLLECTION_ENDPOINT, embedding_dimension_size)
-
-            index_documents(COLLECTION_ENDPOINT, merged_docs)
+            docs = (merge_one(d, embeddings) for d in iter_dataset(DATASET))
         else:
             log.info("Using plain dataset without embeddings")
+            docs = iter_dataset(DATASET)
+
+        # no hard auto commits while the bulk load runs, index_documents commits once at the end
+        set_auto_commit_max_time(COLLECTION_ENDPOINT, -1)
+        try:
             index_documents(COLLECTION_ENDPOINT, docs)
-            Path(TMP_FILE).unlink(missing_ok=True)
+        finally:
+            set_auto_commit_max_time(COLLECTION_ENDPOINT, None)
     else:
         log.info("Skipping indexing as there are already docs indexed. Use FORCE_REINDEX=true to force re-indexing")
 
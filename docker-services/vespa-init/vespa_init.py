@@ -1,23 +1,37 @@
 """
 vespa_init.py
 """
-import io
-import json
 import logging
+import math
 import os
+import queue
+import random
+import socket
+import subprocess
 import sys
+import tempfile
+import threading
 import time
 import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from threading import Lock
-from typing import Optional, Any
+from typing import Optional, Any, BinaryIO, Iterable, Iterator
+from urllib.parse import quote, urlsplit
 
+import ijson
+import numpy as np
+import orjson
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from vespa.application import Vespa
 
 HOST_ENDPOINT = os.getenv("VESPA_ENDPOINT", "http://vespa:8080")
 CONFIG_ENDPOINT = os.getenv("CONFIG_ENDPOINT", "http://vespa:19071")
 APP_PATH = "/opt/app/app"
+# the deploy zip is kept in memory up to this size, larger application packages spill to a temporary file
+APP_ZIP_SPOOL_SIZE = int(os.getenv("APP_ZIP_SPOOL_SIZE", str(256 * 1024 * 1024)))
 SCHEMA_NAME = "doc"
 
 DATASET = os.getenv("DATASET", "/opt/app/data/dataset.json")
@@ -26,11 +40,33 @@ EMBEDDINGS_FOLDER = "/opt/app/embeddings"
 os.makedirs(EMBEDDINGS_FOLDER, exist_ok=True)
 
 EMBEDDINGS_FILE = os.path.join(EMBEDDINGS_FOLDER, "documents_embeddings.jsonl")
+# optional scratch file backing the embeddings matrix (np.memmap), for corpora whose vectors don't fit in RAM
+EMBEDDINGS_MEMMAP = os.getenv("EMBEDDINGS_MEMMAP")
 TMP_FILE = os.getenv("TMP_FILE", "/tmp/merged_dataset.json")
+# the merged dataset is only written to TMP_FILE for debugging, nothing reads it back
+WRITE_MERGED_TMP = os.getenv("WRITE_MERGED_TMP", "false").lower() == "true"
+# ids and errors of the documents that could not be fed, one JSON object per line
+FAILED_DOCS_FILE = os.path.join(EMBEDDINGS_FOLDER, "failed.jsonl")
+# a feed fails only when more than this fraction of the docs could not be indexed
+MAX_FAILED_RATIO = float(os.getenv("MAX_FAILED_RATIO", "0.01"))
 
 DEFAULT_TIMEOUT = int(os.getenv("DEFAULT_TIMEOUT", "600"))
 FORCE_REINDEX = os.getenv("FORCE_REINDEX", "false").lower() == "true"
+# tensor<float> values are parsed to float32 by Vespa whatever their textual precision,
+# so rounding is disabled unless ROUND_DIGITS is set
+ROUND_DIGITS: Optional[int] = int(os.environ["ROUND_DIGITS"]) if os.getenv("ROUND_DIGITS") else None
 INDEX_BATCH_SIZE = 1000
+# batches of INDEX_BATCH_SIZE dataset docs parsed ahead of the merge and the feed by the background parser
+DATASET_QUEUE_SIZE = int(os.getenv("DATASET_QUEUE_SIZE", "8"))
+# a cli feed batch is flushed at INDEX_BATCH_SIZE docs or MAX_BULK_BYTES bytes, whichever comes first
+MAX_BULK_BYTES = int(os.getenv("MAX_BULK_BYTES", str(8 * 1024 * 1024)))
+# pyvespa: async HTTP/2 feeding (default), http1: one /document/v1 POST per doc from a pool of threads,
+# cli: JSONL put operations piped in batches of INDEX_BATCH_SIZE to the `vespa feed` client of vespacli
+FEED_MODE = os.getenv("FEED_MODE", "pyvespa").lower()
+# requests in flight, connections to the container (pyvespa only) and docs queued ahead of the workers
+FEED_MAX_WORKERS = int(os.getenv("FEED_MAX_WORKERS", "64"))
+FEED_MAX_CONNECTIONS = int(os.getenv("FEED_MAX_CONNECTIONS", "1"))
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "4000"))
 
 logging.basicConfig(
     stream=sys.stdout,
@@ -39,76 +75,143 @@ logging.basicConfig(
 )
 log = logging.getLogger("vespa_init")
 
+# shared keep-alive connection pool for the health polls, the deployment and the doc count
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+# http1 feed: one pooled keep-alive connection per worker thread; document puts are idempotent so a POST
+# throttled (429) or hitting a transient server error (5xx) is retried with backoff. It is a bare urllib3 pool,
+# without the per-request preparation of requests (hooks, proxies and env lookups) that costs several times
+# the CPU of the POST itself
+FEED_POOL = urllib3.PoolManager(num_pools=1, maxsize=FEED_MAX_WORKERS,
+                                retries=Retry(total=5, backoff_factor=0.5,
+                                              status_forcelist=(429, 500, 502, 503, 504),
+                                              allowed_methods=frozenset({"POST"}), raise_on_status=False))
+
+
+def _port_open(address: tuple[str, int], timeout: float = 1) -> bool:
+    """Returns True if a TCP connection to address can be opened: a cheap pre-check before the HTTP probe."""
+    try:
+        socket.create_connection(address, timeout=timeout).close()
+        return True
+    except OSError:
+        return False
+
 
-def wait_for_vespa_config_server(config_endpoint: str, timeout: int, interval: float = 1.0) -> None:
-    """Waits until the Vespa Config server is up."""
+def wait_for_vespa_config_server(config_endpoint: str, timeout: int, interval: float = 0.05,
+                                 max_interval: float = 2.0) -> None:
+    """
+    Waits until the Vespa Config server returns 200 at /state/v1/health, polling with jittered backoff (x1.5 up to
+    max_interval). Each poll first checks that the port accepts TCP connections, before any HTTP request.
+    """
     health_url = f"{config_endpoint.rstrip('/')}/state/v1/health"
+    url = urlsplit(config_endpoint)
+    address = (url.hostname or "localhost", url.port or 19071)
     log.info(f"Waiting for Vespa Config server at {health_url} ...")
 
-    start_time = time.time()
+    start_time = time.monotonic()
     deadline = start_time + timeout
+    delay = interval
 
-    while time.time() < deadline:
+    while time.monotonic() < deadline:
         try:
-            response = requests.get(health_url, timeout=5)
-            if response.status_code == 200:
-                log.info(f"Vespa Config server is ready. It took {time.time() - start_time:.2f} seconds.")
+            if _port_open(address) and SESSION.get(health_url, timeout=5).status_code == 200:
+                log.info(f"Vespa Config server is ready. It took {time.monotonic() - start_time:.2f} seconds.")
                 return
         except (requests.RequestException, ValueError):
             pass
 
-        time.sleep(interval)
+        # up to 25% jitter so that restarted init containers don't poll in lockstep
+        time.sleep(min(delay * random.uniform(1.0, 1.25), max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 1.5, max_interval)
     raise RuntimeError(f"Vespa Config server did not become ready after {timeout} seconds: {health_url}")
 
 
+def _scan_files(directory: str, prefix: str = "") -> Iterator[tuple[str, str]]:
+    # DirEntry.is_dir/is_file use the d_type cached by readdir, only symlinks need an extra stat;
+    # like os.walk, symlinked files are included and symlinked directories are not followed
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            archive_name = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_files(entry.path, archive_name + "/")
+            elif entry.is_file():
+                yield entry.path, archive_name
+
+
+def list_app_files(app_path: str) -> list[tuple[str, str]]:
+    """Returns (file path, archive name) of every file in the application package, in a stable order."""
+    return sorted(_scan_files(app_path), key=lambda entry: entry[1])
+
+
+def iter_app_zip(app_files: list[tuple[str, str]], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Streams a zip of the application files, stored uncompressed: deflate buys nothing for a package uploaded
+    to the local config server. The zip is written to a SpooledTemporaryFile, in memory up to
+    APP_ZIP_SPOOL_SIZE bytes and on disk beyond, and read back in chunk_size pieces. The file must be seekable:
+    zipfile writes stored entries to an unseekable sink with data descriptors, which the config server's zip
+    reader rejects.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=APP_ZIP_SPOOL_SIZE) as archive:
+        try:
+            with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zip_file:
+                for file_path, archive_name in app_files:
+                    zip_file.write(file_path, archive_name)
+        except Exception as e:
+            raise Exception(f"Unable to zip the application package: {e}") from e
+        archive.seek(0)
+        while chunk := archive.read(chunk_size):
+            yield chunk
+
+
 def deploy_vespa_app(app_path: str, config_endpoint: str) -> None:
     """
     Deploys the Vespa application package.
-    This zips the folder at `app_path` in-memory and posts it to: /application/v2/tenant/default/prepareandactivate
+    This zips the folder at `app_path` on the fly and streams it to: /application/v2/tenant/default/prepareandactivate
     """
     deploy_url = f"{config_endpoint.rstrip('/')}/application/v2/tenant/default/prepareandactivate"
 
-    log.info(f"Zipping application from {app_path} ...")
-
-    # Create an in-memory zip of the application folder
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for root, _, files in os.walk(app_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                archive_name = os.path.relpath(file_path, app_path)
-                zip_file.write(file_path, archive_name)
+    app_files = list_app_files(app_path)
+    log.info(f"Zipping {len(app_files)} files from {app_path} ...")
 
-    zip_buffer.seek(0)
     log.info(f"Deploying (uploading zip) to {deploy_url} ...")
 
     try:
-        response = requests.post(deploy_url, headers={"Content-Type": "application/zip"}, data=zip_buffer,
-                                 timeout=DEFAULT_TIMEOUT)
+        response = SESSION.post(deploy_url, headers={"Content-Type": "application/zip"}, data=iter_app_zip(app_files),
+                                timeout=DEFAULT_TIMEOUT)
         response.raise_for_status()
-        log.info(f"Deployment successful. Response: {response.json()}")
+        log.info(f"Deployment successful. Response: {response.text[:500]}")
     except requests.RequestException as e:
         log.error(f"Vespa deployment failed: {e}")
         raise
 
 
-def wait_for_vespa_app(host_endpoint: str, timeout: int, interval: float = 1.0) -> None:
-    """ Waits until the Vespa app/container returns 200 at /status.html."""
+def wait_for_vespa_app(host_endpoint: str, timeout: int, interval: float = 0.05,
+                       max_interval: float = 2.0) -> None:
+    """
+    Waits until the Vespa app/container returns 200 at /status.html, polling with jittered backoff (x1.5 up to
+    max_interval). Each poll first checks that the port accepts TCP connections, before any HTTP request.
+    """
     health_url = f"{host_endpoint.rstrip('/')}/status.html"
+    url = urlsplit(host_endpoint)
+    address = (url.hostname or "localhost", url.port or 8080)
     log.info(f"Waiting for Vespa app at {health_url} ...")
 
-    start_time = time.time()
+    start_time = time.monotonic()
     deadline = start_time + timeout
+    delay = interval
 
-    while time.time() < deadline:
+    while time.monotonic() < deadline:
         try:
-            response = requests.get(health_url, timeout=5)
-            if response.status_code == 200:
-                log.info(f"Vespa app is ready. It took {time.time() - start_time:.2f} seconds.")
+            if _port_open(address) and SESSION.get(health_url, timeout=5).status_code == 200:
+                log.info(f"Vespa app is ready. It took {time.monotonic() - start_time:.2f} seconds.")
                 return
         except requests.RequestException:
             pass
-        time.sleep(interval)
+        # up to 25% jitter so that restarted init containers don't poll in lockstep
+        time.sleep(min(delay * random.uniform(1.0, 1.25), max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 1.5, max_interval)
     raise RuntimeError(f"Vespa app did not become ready after {timeout} seconds: {health_url}")
 
 
@@ -119,128 +222,259 @@ def get_vespa_doc_count(host_endpoint: str, timeout: int = 5) -> int:
     """
     search_url = f"{host_endpoint.rstrip('/')}/search/"
 
+    # hits=0: only the totalCount is needed, no hits nor summaries;
+    # unranked: the built-in rank profile that skips scoring the matched docs
     params = {
-        "yql": "select * from sources * where true limit 0"
+        "yql": "select * from sources * where true limit 0",
+        "hits": 0,
+        "ranking": "unranked"
     }
 
     try:
-        response = requests.get(search_url, params=params, timeout=timeout)
+        response = SESSION.get(search_url, params=params, timeout=timeout)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         return int(data.get("root", {}).get("fields", {}).get("totalCount", 0))
     except Exception as e:
         log.error(f"Unable to get document count from Vespa: {e}")
         raise
 
 
-def load_dataset_to_dict(path: str) -> list[dict[str, Any]]:
-    """Loads dataset (json) """
-    p = Path(path)
-    if not p.exists():
-        raise FileNotFoundError(f"Dataset file not found: {path}")
-    with p.open("r", encoding="utf-8") as file:
-        data = json.load(file)
-        if isinstance(data, list):
-            return data
-        else:
-            raise ValueError("Expected dataset JSON file to be an array of documents")
+def _iter_json_array(file: BinaryIO) -> Iterator[dict[str, Any]]:
+    with file:
+        for doc in ijson.items(file, "item", use_float=True):
+            # the authors field is an array in the Vespa schema
+            authors = doc.get("authors")
+            if isinstance(authors, str):
+                doc["authors"] = [authors]
+            yield doc
 
 
-def load_embeddings_to_dict(path: str) -> dict[str, list[float]]:
+def iter_dataset(path: str) -> Iterator[dict[str, Any]]:
+    """Streams dataset docs from a JSON array file, one item at a time, with a single authors string wrapped
+    in a list."""
+    # opened here rather than in the generator, so that a missing file fails right away
+    try:
+        file = open(path, "rb", buffering=1 << 20)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Dataset file not found: {path}") from None
+    return _iter_json_array(file)
+
+
+def _produce_batches(items: Iterable[Any], batches: "queue.Queue[Any]", stop: threading.Event) -> None:
     """
-    Loads embeddings from jsonl file to dict. Each line: {"id":"...","vector":[...] }
-    Returns dict of (id, [vector])
+    Pulls items on a background thread and hands them over in lists of INDEX_BATCH_SIZE through the bounded
+    `batches` queue. Ends with None, or with the exception raised.
     """
-    vectors: dict[str, list[float]] = {}
-    p = Path(path)
-    if not p.exists():
-        log.info(f"Embeddings file not found: {path}")
-        return vectors
-    with p.open("r", encoding="utf-8") as file:
-        for i, line in enumerate(file, start=1):
-            line = line.strip()
-            if not line:
-                continue
+    def _put(item: Any) -> bool:
+        while not stop.is_set():
             try:
-                row = json.loads(line)
+                batches.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        buf = []
+        for item in items:
+            buf.append(item)
+            if len(buf) >= INDEX_BATCH_SIZE:
+                if not _put(buf):
+                    return
+                buf = []
+        if buf and not _put(buf):
+            return
+        _put(None)
+    except Exception as e:
+        _put(e)
+
+
+def _consume_batches(batches: "queue.Queue[Any]", stop: threading.Event,
+                     producer: threading.Thread) -> Iterator[Any]:
+    try:
+        while (item := batches.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def iter_in_background(items: Iterable[Any]) -> Iterator[Any]:
+    """
+    Starts iterating `items` right away on a background thread, at most DATASET_QUEUE_SIZE batches ahead of
+    the consumer, so that producing the items overlaps whatever the caller does meanwhile and then the feed.
+    """
+    batches: "queue.Queue[Any]" = queue.Queue(maxsize=DATASET_QUEUE_SIZE)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce_batches, args=(items, batches, stop), name="doc-producer",
+                                daemon=True)
+    producer.start()
+    return _consume_batches(batches, stop, producer)
+
+
+def count_lines(file: BinaryIO, chunk_size: int = 1 << 20) -> int:
+    """Counts the lines of the open file with bytes.count (memchr) over chunk_size reads, a trailing unterminated
+    line included, then rewinds it."""
+    lines = 0
+    last = b"\n"
+    while chunk := file.read(chunk_size):
+        lines += chunk.count(b"\n")
+        last = chunk
+    file.seek(0)
+    return lines + (not last.endswith(b"\n"))
+
+
+def load_embeddings_to_dict(path: str, memmap_path: Optional[str] = None) -> tuple[dict[str, int], np.ndarray]:
+    """
+    Streams embeddings from jsonl file into a contiguous float32 matrix, one line at a time.
+    Each line: {"id":"...","vector":[...] }
+    The matrix lives in memory, or in a np.memmap of memmap_path if given, so that only the pages in use stay
+    resident. Returns dict of (id, row) and the (N, dim) matrix holding the vectors
+    """
+    ids_to_row: dict[str, int] = {}
+    matrix = np.empty((0, 0), dtype=np.float32)
+    try:
+        file = open(path, "rb", buffering=1 << 20)
+    except FileNotFoundError:
+        log.info(f"Embeddings file not found: {path}")
+        return ids_to_row, matrix
+    with file:
+        # one record per line: the line count sizes the matrix once
+        num_lines = count_lines(file)
+        i = 0
+        try:
+            for i, line in enumerate(file, start=1):
+                # isspace() stops at the first non blank byte, strip() would copy the whole line
+                if line.isspace():
+                    continue
+                row = orjson.loads(line)
                 _id = row.get("id")
                 vector = row.get("vector")
-                if _id and isinstance(vector, list):
-                    vectors[str(_id)] = vector
-                else:
+                if not (_id and isinstance(vector, list)):
                     log.debug(f"Skipping embeddings line {i}: missing id or vector")
-            except Exception as e:
-                log.error("Exception in embeddings file", e)
-                raise
-    log.info("Loaded %d embeddings from %s", len(vectors), path)
-    return vectors
-
-
-def round_vector(vector: list[float], digits: int = 12) -> list[float]:
-    """Rounds each value in the vector to digits=12 decimals."""
-    return [round(float(x), digits) for x in vector]
-
-
-def merge_docs_with_embeddings(docs: list[dict[str, Any]], embeddings: dict[str, list[float]],
-                               output_path: Optional[str] = None) -> list[dict[str, Any]]:
-    """ Merges two dicts one containing the doc fields e.g. title, context, etc.
-    while the other one contains <id, vector> fields"""
-    merged = []
-    for d in docs:
-        doc = dict(d)
-        doc_id = str(doc.get("id"))
-        if not doc_id:
+                    continue
+                if not ids_to_row:
+                    shape = (num_lines, len(vector))
+                    # viewed as a plain ndarray: orjson does not serialize ndarray subclasses like np.memmap
+                    matrix = (np.memmap(memmap_path, dtype=np.float32, mode="w+", shape=shape).view(np.ndarray)
+                              if memmap_path else np.empty(shape, dtype=np.float32))
+                matrix[ids_to_row.setdefault(_id if isinstance(_id, str) else str(_id), len(ids_to_row))] = vector
+        except Exception as e:
+            log.error(f"Exception in embeddings file at line {i}: {e}")
+            raise
+    log.info("Loaded %d embeddings from %s", len(ids_to_row), path)
+    return ids_to_row, matrix[:len(ids_to_row)]
+
+
+def round_matrix(matrix: np.ndarray, digits: int, block_rows: int = 4096) -> None:
+    """
+    Rounds the float32 matrix in place to digits decimals, block_rows rows at a time.
+    Values are rounded in float64: scaling by 10**digits in float32 would itself perturb the last bits.
+    Only values below 2**(floor(log2(10**-digits)) + 24) are touched: above it the float32 spacing exceeds
+    10**-digits, so rounding moves a value by less than half a float32 step and it casts back unchanged.
+    """
+    threshold = np.float32(2.0 ** (math.floor(math.log2(10.0 ** -digits)) + 24))
+    for start in range(0, matrix.shape[0], block_rows):
+        block = matrix[start:start + block_rows]
+        small = np.abs(block) < threshold
+        if small.any():
+            block[small] = np.round(block[small].astype(np.float64), digits)
+
+
+def merge_docs_with_embeddings(docs: Iterable[dict[str, Any]], ids_to_row: dict[str, int], matrix: np.ndarray,
+                               digits: Optional[int] = None) -> Iterator[dict[str, Any]]:
+    """ Merges the docs containing the fields e.g. title, context, etc.
+    with the embeddings matrix, whose rows are looked up by <id, row>. The docs are updated in place and yielded,
+    with the vector as a view of the matrix row.
+    The matrix is rounded in place to digits decimals in a single pass, unless digits is None"""
+    if digits is not None:
+        round_matrix(matrix, digits)
+    for doc in docs:
+        doc_id = doc.get("id")
+        if doc_id is None:
             log.error("Document missing id")
-        vector = embeddings.get(doc_id)
-        if vector is not None:
-            doc["vector"] = round_vector(vector, digits=12)
-        merged.append(doc)
-    if output_path:
-        with open(output_path, "w", encoding="utf-8") as file:
-            json.dump(merged, file, ensure_ascii=False)
-        log.info(f"Wrote merged dataset to {output_path}")
-    return merged
+        else:
+            row = ids_to_row.get(doc_id if isinstance(doc_id, str) else str(doc_id))
+            if row is not None:
+                doc["vector"] = matrix[row]
+        yield doc
+
+
+def write_docs_to_file(docs: Iterable[dict[str, Any]], output_path: str) -> Iterator[dict[str, Any]]:
+    """Yields the docs unchanged while streaming them to output_path as a JSON array."""
+    with open(output_path, "wb") as file:
+        file.write(b"[")
+        for i, doc in enumerate(docs):
+            # vectors are serialized straight from the float32 matrix rows, no tolist() round-trip
+            encoded = orjson.dumps(doc, option=orjson.OPT_SERIALIZE_NUMPY)
+            file.write(b"," + encoded if i else encoded)
+            yield doc
+        file.write(b"]")
+        file.flush()
+        if hasattr(os, "posix_fadvise"):
+            # written once and never read back: keep it from evicting the dataset from the page cache
+            os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    log.info(f"Wrote merged dataset to {output_path}")
 
 
 class IndexingCounter:
-    def __init__(self, total_docs):
-        self.num_docs = total_docs
-        self._lock = Lock()
+    # list.append is atomic, so feed callbacks can record errors from any thread without taking a lock
+    def __init__(self):
+        self.failed: list[tuple[str, str]] = []
 
-    def count_error(self):
-        with self._lock:
-            self.num_docs -= 1
+    def count_error(self, doc_id: str, error: str):
+        self.failed.append((doc_id, error))
 
-    def get_indexed_docs_count(self):
-        return self.num_docs
+    def get_errors_count(self):
+        return len(self.failed)
 
 
-def feed_vespa_documents(host_endpoint: str, schema: str, docs: list[dict[str, Any]]) -> None:
+def check_failed_docs(failed: list[tuple[str, str]], failed_count: int, total_docs: int) -> None:
     """
-    Feeds documents using pyvespa by streaming over iterable type
+    Writes the (doc_id, error) pairs of the failed docs to FAILED_DOCS_FILE, so they can be inspected and re-fed,
+    and raises if more than MAX_FAILED_RATIO of the total_docs failed.
     """
-    total_docs = len(docs)
-    if total_docs == 0:
-        log.warning("No documents provided for indexing.")
-        return
+    if failed:
+        with open(FAILED_DOCS_FILE, "wb") as f:
+            for doc_id, error in failed:
+                f.write(orjson.dumps({"id": doc_id, "error": error}))
+                f.write(b"\n")
+        log.warning(f"Wrote {len(failed)} failed docs to {FAILED_DOCS_FILE}")
+    else:
+        # drop the failures left by a previous run
+        Path(FAILED_DOCS_FILE).unlink(missing_ok=True)
+
+    if total_docs and failed_count / total_docs > MAX_FAILED_RATIO:
+        raise Exception(f"Failed to index {failed_count} out of {total_docs} docs, "
+                        f"more than the allowed {MAX_FAILED_RATIO:.2%}")
+
 
+def feed_vespa_documents(host_endpoint: str, schema: str, docs: Iterable[dict[str, Any]]) -> None:
+    """
+    Feeds documents using pyvespa by streaming over iterable type, asynchronously over HTTP/2
+    """
     running_vespa_app = Vespa(url=host_endpoint)
-    indexing_counter = IndexingCounter(total_docs)
+    indexing_counter = IndexingCounter()
+    total_docs = 0
 
     def _callback(response, doc_id):
         if not response.is_successful():
             log.error(f"Failed to feed document {doc_id}: {response.json}")
-            indexing_counter.count_error()
+            indexing_counter.count_error(doc_id, str(response.json))
         else:
             log.debug(f"Indexed doc with doc_id {doc_id}")
 
     def _document_generator():
+        nonlocal total_docs
         for doc in docs:
-            doc_id = str(doc.pop("id"))
-
-            if "authors" in doc and isinstance(doc["authors"], str):
-                doc["authors"] = [doc["authors"]]
-
+            total_docs += 1
+            doc_id = str(doc["id"])
+            vector = doc.get("vector")
+            if isinstance(vector, np.ndarray):
+                doc["vector"] = vector.tolist()
             yield {
                 "id": doc_id,
                 "fields": doc,
@@ -248,27 +482,155 @@ def feed_vespa_documents(host_endpoint: str, schema: str, docs: list[dict[str, A
             }
 
     start_time = time.time()
-    log.info(f"Started indexing {total_docs} docs into Vespa schema {schema}")
+    log.info(f"Started indexing docs into Vespa schema {schema}")
 
-    # HTTP/2 with concurrency: 16 workers, 4k memory
-    running_vespa_app.feed_iterable(iter=_document_generator(),
-                                    schema=schema,
-                                    callback=_callback,
-                                    max_queue_size=4000,
-                                    max_workers=16)
+    # asyncio + httpx HTTP/2: FEED_MAX_WORKERS requests multiplexed over FEED_MAX_CONNECTIONS connections
+    running_vespa_app.feed_async_iterable(iter=_document_generator(),
+                                          schema=schema,
+                                          callback=_callback,
+                                          max_queue_size=FEED_QUEUE_SIZE,
+                                          max_workers=FEED_MAX_WORKERS,
+                                          max_connections=FEED_MAX_CONNECTIONS)
 
-    indexed_docs_count = indexing_counter.get_indexed_docs_count()
+    if total_docs == 0:
+        log.warning("No documents provided for indexing.")
+        return
+
+    indexed_docs_count = total_docs - indexing_counter.get_errors_count()
     end_time = time.time()
     log.info(f"Indexing finished. It took {(end_time - start_time):.2f} seconds. "
              f"Successfully indexed: {indexed_docs_count} out of {total_docs} docs.")
+    check_failed_docs(indexing_counter.failed, indexing_counter.get_errors_count(), total_docs)
+
+
+def feed_vespa_documents_http1(host_endpoint: str, schema: str, docs: Iterable[dict[str, Any]]) -> None:
+    """
+    Feeds documents through the /document/v1 API, one POST per document, from FEED_MAX_WORKERS threads
+    sharing the keep-alive FEED_POOL. At most FEED_QUEUE_SIZE documents are in flight at once.
+    """
+    docs_url = f"{host_endpoint.rstrip('/')}/document/v1/{schema}/{schema}/docid/"
+    # resolved once: each POST then only concatenates the quoted doc id to the path
+    pool = FEED_POOL.connection_from_url(docs_url)
+    docs_path = urlsplit(docs_url).path
+    headers = {"Content-Type": "application/json"}
+    indexing_counter = IndexingCounter()
+    total_docs = 0
+
+    def _post(doc_id: str, doc: dict[str, Any]) -> None:
+        try:
+            # the doc is sent as-is (id included, the schema has an id field) and left unmodified for retries
+            body = b'{"fields":' + orjson.dumps(doc, option=orjson.OPT_SERIALIZE_NUMPY) + b'}'
+            response = pool.urlopen("POST", docs_path + quote(doc_id, safe=""), body=body, headers=headers,
+                                    timeout=DEFAULT_TIMEOUT)
+            if response.status < 400:
+                log.debug(f"Indexed doc with doc_id {doc_id}")
+                return
+            error = response.data.decode("utf-8", "replace")
+        except Exception as e:
+            error = str(e)
+        log.error(f"Failed to feed document {doc_id}: {error}")
+        indexing_counter.count_error(doc_id, error)
+
+    start_time = time.time()
+    log.info(f"Started indexing docs into Vespa schema {schema} over /document/v1")
+
+    with ThreadPoolExecutor(max_workers=FEED_MAX_WORKERS) as executor:
+        in_flight: set[Future] = set()
+        for doc in docs:
+            total_docs += 1
+            if len(in_flight) >= FEED_QUEUE_SIZE:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            in_flight.add(executor.submit(_post, str(doc["id"]), doc))
+            if total_docs % INDEX_BATCH_SIZE == 0:
+                log.info(f"Submitted {total_docs} docs")
+
+    if total_docs == 0:
+        log.warning("No documents provided for indexing.")
+        return
+
+    indexed_docs_count = total_docs - indexing_counter.get_errors_count()
+    end_time = time.time()
+    log.info(f"Indexing finished. It took {(end_time - start_time):.2f} seconds. "
+             f"Successfully indexed: {indexed_docs_count} out of {total_docs} docs.")
+    check_failed_docs(indexing_counter.failed, indexing_counter.get_errors_count(), total_docs)
+
+
+def _iter_feed_batches(schema: str, docs: Iterable[dict[str, Any]]) -> Iterator[tuple[int, bytes]]:
+    """
+    Serializes docs into JSONL put operations, batched by at most INDEX_BATCH_SIZE docs or MAX_BULK_BYTES bytes.
+    Yields (number of docs, payload) tuples.
+    """
+    buf: list[bytes] = []
+    size = 0
+    for doc in docs:
+        encoded = orjson.dumps({"put": f"id:{schema}:{schema}::{doc['id']}", "fields": doc},
+                               option=orjson.OPT_SERIALIZE_NUMPY)
+        buf.append(encoded)
+        size += len(encoded) + 1
+        if size >= MAX_BULK_BYTES or len(buf) >= INDEX_BATCH_SIZE:
+            yield len(buf), b"\n".join(buf) + b"\n"
+            buf = []
+            size = 0
+    if buf:
+        yield len(buf), b"\n".join(buf) + b"\n"
+
+
+def feed_vespa_documents_cli(host_endpoint: str, schema: str, docs: Iterable[dict[str, Any]]) -> None:
+    """
+    Feeds documents as JSONL put operations piped to `vespa feed` (vespacli), which pipelines them over HTTP/2.
+    Vespa has no multi-document POST endpoint: each batch of operations is joined into a single write to the
+    feed client stdin instead.
+    """
+    command = ["vespa", "feed", "--target", host_endpoint, "-"]
+    total_docs = 0
+
+    start_time = time.time()
+    log.info(f"Started indexing docs into Vespa schema {schema} with {' '.join(command)}")
+
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    except OSError as e:
+        raise Exception(f"Unable to start the Vespa feed client: {e}") from e
+    try:
+        for num_docs, payload in _iter_feed_batches(schema, docs):
+            process.stdin.write(payload)
+            total_docs += num_docs
+            log.info(f"Submitted {total_docs} docs")
+    except BaseException as e:
+        # with its stdin left open the feed client would wait for more operations forever
+        process.kill()
+        process.communicate()
+        if isinstance(e, BrokenPipeError):
+            raise Exception(f"Vespa feed client exited early with code {process.returncode}") from e
+        raise
+    # closes stdin, then reads the feed metrics printed as JSON on stdout once all operations are done
+    output, _ = process.communicate()
+
+    if process.returncode != 0:
+        raise Exception(f"Vespa feed client failed with code {process.returncode}")
+
+    if total_docs == 0:
+        log.warning("No documents provided for indexing.")
+        return
+
+    # failed operations are logged by the feed client itself
+    try:
+        indexed_docs_count = int(orjson.loads(output).get("feeder.ok.count", 0))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise Exception(f"Unable to read the Vespa feed client metrics from its output: {output[:200]!r}") from e
+    end_time = time.time()
+    log.info(f"Indexing finished. It took {(end_time - start_time):.2f} seconds. "
+             f"Successfully indexed: {indexed_docs_count} out of {total_docs} docs.")
+    # the feed client only reports counts, so there are no doc ids to write out
+    check_failed_docs([], total_docs - indexed_docs_count, total_docs)
 
 
 def main() -> int:
     log.info("Starting vespa_init.py")
     try:
-        wait_for_vespa_config_server(config_endpoint=CONFIG_ENDPOINT, timeout=DEFAULT_TIMEOUT, interval=1.0)
+        wait_for_vespa_config_server(config_endpoint=CONFIG_ENDPOINT, timeout=DEFAULT_TIMEOUT)
         deploy_vespa_app(app_path=APP_PATH, config_endpoint=CONFIG_ENDPOINT)
-        wait_for_vespa_app(host_endpoint=HOST_ENDPOINT, timeout=DEFAULT_TIMEOUT, interval=1.0)
+        wait_for_vespa_app(host_endpoint=HOST_ENDPOINT, timeout=DEFAULT_TIMEOUT)
     except Exception as e:
         log.error(f"Vespa is not available: {e}")
         sys.exit(1)
@@ -277,17 +639,28 @@ def main() -> int:
     log.info(f"Vespa has {count_docs} docs")
 
     if count_docs == 0 or FORCE_REINDEX:
-        docs = load_dataset_to_dict(DATASET)
-        embeddings = load_embeddings_to_dict(EMBEDDINGS_FILE)
+        # the dataset is parsed in the background while the embeddings load, and then while the docs are fed
+        docs = iter_in_background(iter_dataset(DATASET))
+        ids_to_row, matrix = load_embeddings_to_dict(EMBEDDINGS_FILE, memmap_path=EMBEDDINGS_MEMMAP)
 
-        if embeddings:
+        if ids_to_row:
             log.info("Using merged dataset with embeddings")
-            merged_docs = merge_docs_with_embeddings(docs, embeddings, output_path=TMP_FILE)
-            feed_vespa_documents(host_endpoint=HOST_ENDPOINT, schema=SCHEMA_NAME, docs=merged_docs)
+            docs = merge_docs_with_embeddings(docs, ids_to_row, matrix, digits=ROUND_DIGITS)
+            if WRITE_MERGED_TMP:
+                docs = write_docs_to_file(docs, TMP_FILE)
         else:
             log.info("Using plain dataset without embeddings")
+        if FEED_MODE == "http1":
+            feed_vespa_documents_http1(host_endpoint=HOST_ENDPOINT, schema=SCHEMA_NAME, docs=docs)
+        elif FEED_MODE == "cli":
+            feed_vespa_documents_cli(host_endpoint=HOST_ENDPOINT, schema=SCHEMA_NAME, docs=docs)
+        else:
             feed_vespa_documents(host_endpoint=HOST_ENDPOINT, schema=SCHEMA_NAME, docs=docs)
+        if not (ids_to_row and WRITE_MERGED_TMP):
+            # drop a stale merged dataset left by a previous run
             Path(TMP_FILE).unlink(missing_ok=True)
+        if EMBEDDINGS_MEMMAP:
+            Path(EMBEDDINGS_MEMMAP).unlink(missing_ok=True)
     else:
         log.info("Skipping indexing as there are already docs indexed. Use FORCE_REINDEX=true to force re-indexing")
 